@@ -1,239 +1,409 @@
+import gzip
 import json
-from typing import Any, Dict, Iterable, List, Optional
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Optional faster JSON libraries; the decoder and encoder are each picked once below.
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+_IO_BUFFER_SIZE = 1 << 20
+_WRITE_BATCH_BYTES = 1 << 16
+
+# Output groups, in the order they are reported; each is written to <out_dir>/<group>.jsonl[.gz]
+_GROUPS = (
+    "general_qa",
+    "agent_basic",
+    "rag_core",
+    "document_retrieval",
+    "response_completeness",
+)
+
+# Fields kept when slimming tool definitions and tool calls
+_TOOL_DEF_KEYS = frozenset(("name", "type", "description", "parameters", "operationId"))
+_TOOL_CALL_KEYS = ("name", "arguments")
+
+# Explicit context fields, in order of preference
+_CONTEXT_KEYS = ("context", "retrieved_context", "evidence", "citations")
+
+
+def _json_dumps_str(obj: Any) -> str:
+    """Encode a value as a compact JSON string with the standard library."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+# Decoding: msgspec > ujson > json. All three keep integers of any width as int.
+# orjson is not used to decode: it silently turns integers outside the 64-bit
+# range (e.g. long document IDs) into floats.
+if msgspec is not None:
+    _msgspec_decode = msgspec.json.decode
+
+    def _loads(line: bytes) -> Any:
+        """Decode one JSON document."""
+        try:
+            return _msgspec_decode(line)
+        except msgspec.MsgspecError:
+            # msgspec rejects the NaN/Infinity literals (and out-of-range
+            # floats) that json.loads accepts; malformed lines raise from there
+            return json.loads(line)
+elif ujson is not None:
+    _loads = ujson.loads
+else:
+    _loads = json.loads
+
+# Encoding: msgspec > orjson > ujson > json. msgspec and orjson write non-finite
+# floats (NaN, Infinity) as null, where ujson and json write the non-standard
+# NaN/Infinity literals; the output is otherwise the same.
+if msgspec is not None:
+    _msgspec_encode = msgspec.json.encode
+
+    def _dumps_line(row: Dict[str, Any]) -> bytes:
+        """Encode a row as one UTF-8 JSONL line, newline included."""
+        return _msgspec_encode(row) + b"\n"
+
+    def _dumps_str(obj: Any) -> str:
+        """Encode a value as a compact JSON string."""
+        return _msgspec_encode(obj).decode("utf-8")
+elif orjson is not None:
+    # orjson raises TypeError for integers beyond 64 bits; such values (and any
+    # other type it cannot handle) go through the standard library instead.
+    def _dumps_line(row: Dict[str, Any]) -> bytes:
+        """Encode a row as one UTF-8 JSONL line, newline included."""
+        try:
+            return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return (_json_dumps_str(row) + "\n").encode("utf-8")
+
+    def _dumps_str(obj: Any) -> str:
+        """Encode a value as a compact JSON string."""
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            return _json_dumps_str(obj)
+elif ujson is not None:
+    def _dumps_str(obj: Any) -> str:
+        """Encode a value as a compact JSON string."""
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+    def _dumps_line(row: Dict[str, Any]) -> bytes:
+        """Encode a row as one UTF-8 JSONL line, newline included."""
+        return (_dumps_str(row) + "\n").encode("utf-8")
+else:
+    _dumps_str = _json_dumps_str
+
+    def _dumps_line(row: Dict[str, Any]) -> bytes:
+        """Encode a row as one UTF-8 JSONL line, newline included."""
+        return (_dumps_str(row) + "\n").encode("utf-8")
+
+
+def _open_input(path: str) -> IO[bytes]:
+    """Open a JSONL file for binary reading, transparently decompressing *.gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb", buffering=_IO_BUFFER_SIZE)
+
+
+def _wrap_output(raw: IO[bytes], compress: bool, name: str) -> IO[bytes]:
+    """
+    Return the stream to write JSONL into: `raw` itself, or a gzip writer on top
+    of it that records `name` as the original file name. The caller closes `raw`;
+    GzipFile leaves a passed-in file object open.
+    """
+    if compress:
+        # Level 1 keeps compression cheap; mtime=0 keeps output reproducible.
+        return gzip.GzipFile(filename=name, fileobj=raw, mode="wb", compresslevel=1, mtime=0)
+    return raw
 
 
-def _read_jsonl(path: str) -> Iterable[Dict[str, Any]]:
-    with open(path, "r", encoding="utf-8") as f:
+def _read_jsonl(
+    path: str, start: int = 0, end: Optional[int] = None
+) -> Iterable[Dict[str, Any]]:
+    """
+    Yield the JSON objects in a JSONL file.
+    If given, only lines starting in the byte range [start, end) are read;
+    ranges are only supported for uncompressed files.
+    """
+    with _open_input(path) as f:
+        if start:
+            f.seek(start)
+        pos = start
         for line in f:
-            line = line.strip()
-            if not line:
+            if end is not None:
+                if pos >= end:
+                    break
+                pos += len(line)
+            # isspace() stops at the first non-blank byte, unlike strip() which
+            # copies the whole line; all decoders accept surrounding whitespace
+            if line.isspace():
                 continue
-            yield json.loads(line)
+            yield _loads(line)
 
 
-def _write_jsonl(path: str, rows: Iterable[Dict[str, Any]]) -> None:
-    with open(path, "w", encoding="utf-8") as f:
-        for row in rows:
-            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+def _split_line_ranges(path: str, n: int) -> List[Tuple[int, int]]:
+    """Split a file into up to n contiguous byte ranges aligned on line starts."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for k in range(1, n):
+            f.seek(size * k // n)
+            f.readline()  # skip to the start of the next line
+            bounds.append(max(f.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
 
 
-def _extract_last_user_text(messages: List[Dict[str, Any]]) -> Optional[str]:
-    """Extract the last user message text from a message list."""
-    for m in reversed(messages):
-        if not isinstance(m, dict):
-            continue
-        if m.get("role") != "user":
-            continue
-        content = m.get("content")
-        if isinstance(content, str):
-            return content
-        if isinstance(content, list):
-            for part in content:
-                if isinstance(part, dict) and part.get("type") == "text":
-                    text = part.get("text")
-                    if text:
-                        return text
-    return None
-
-
-def _last_user_query(item: Dict[str, Any]) -> Optional[str]:
-    """Get the last user query from the item."""
-    q = item.get("query")
-    if isinstance(q, str):
-        return q
-    if isinstance(q, list):
-        return _extract_last_user_text(q)
-    return None
-
-
-def _extract_last_assistant_text(messages: List[Dict[str, Any]]) -> Optional[str]:
-    """Extract the last assistant message text from a message list."""
-    for m in reversed(messages):
-        if not isinstance(m, dict):
-            continue
-        if m.get("role") != "assistant":
-            continue
-        content = m.get("content")
-        if isinstance(content, str):
-            return content
-        if isinstance(content, list):
-            for part in content:
-                if isinstance(part, dict) and part.get("type") == "text":
-                    text = part.get("text")
-                    if text:
-                        return text
-    return None
-
+class _JsonlWriter:
+    """
+    Stream rows to a JSONL file as they are produced.
+    Writes go to a temporary file that replaces `path` on commit(), so a
+    failed run never leaves a partially written output behind.
+    """
 
-def _final_assistant_response(item: Dict[str, Any]) -> Optional[str]:
-    """Get the final assistant response from the item."""
-    r = item.get("response")
-    if isinstance(r, str):
-        return r
-    if isinstance(r, list):
-        return _extract_last_assistant_text(r)
+    def __init__(self, path: str, name: Optional[str] = None) -> None:
+        self.path = path
+        self.count = 0
+        self._tmp_path = path + ".tmp"
+        self._raw = open(self._tmp_path, "wb", buffering=_IO_BUFFER_SIZE)
+        # A gzip header names the final file, not the temporary (or part) file
+        self._f = _wrap_output(
+            self._raw, path.endswith(".gz"), name or os.path.basename(path)
+        )
+        self._batch: List[bytes] = []
+        self._size = 0
+
+    def write(self, row: Dict[str, Any]) -> None:
+        """Encode a row, handing lines to the file in ~64 KiB batches."""
+        line = _dumps_line(row)
+        self._batch.append(line)
+        self._size += len(line)
+        self.count += 1
+        if self._size >= _WRITE_BATCH_BYTES:
+            self._flush()
+
+    def commit(self) -> None:
+        """Flush remaining rows and atomically move the file into place."""
+        self._flush()
+        self._close()
+        os.replace(self._tmp_path, self.path)
+
+    def discard(self) -> None:
+        """Close and remove the temporary file."""
+        self._close()
+        os.remove(self._tmp_path)
+
+    def _close(self) -> None:
+        self._f.close()
+        self._raw.close()
+
+    def _flush(self) -> None:
+        if self._batch:
+            self._f.write(b"".join(self._batch))
+            self._batch.clear()
+            self._size = 0
+
+
+# Items come straight from the JSON decoder, which only produces exact dict/list/str
+# instances, so the helpers below use cheap `type(x) is ...` checks over isinstance().
+
+
+def _message_text(content: Any) -> Optional[str]:
+    """Get a message's text: string content, or its last non-empty text part."""
+    if type(content) is str:
+        return content
+    if type(content) is list:
+        for part in reversed(content):
+            if type(part) is dict and part.get("type") == "text":
+                text = part.get("text")
+                if text:
+                    return text
     return None
 
 
-def _slim_tool_definitions(item: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
-    """Extract slim tool definitions."""
-    tools = item.get("tool_definitions") or item.get("tools")
-    if not isinstance(tools, list):
+def _slim_tool_definitions(tools: Any) -> Optional[List[Dict[str, Any]]]:
+    """Extract slim tool definitions from an item's tool_definitions/tools value."""
+    if type(tools) is not list:
         return None
     slim: List[Dict[str, Any]] = []
     for t in tools:
-        if not isinstance(t, dict):
+        if type(t) is not dict:
             continue
-        entry: Dict[str, Any] = {
-            k: v
-            for k, v in t.items()
-            if k in {"name", "type", "description", "parameters", "operationId"}
-        }
+        entry: Dict[str, Any] = {k: v for k, v in t.items() if k in _TOOL_DEF_KEYS}
         if entry:
             slim.append(entry)
     return slim or None
 
 
-def _slim_tool_calls(item: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
-    """Extract slim tool calls."""
-    calls = item.get("tool_calls") or item.get("tools_called")
-    if not isinstance(calls, list):
+def _slim_tool_calls(calls: Any) -> Optional[List[Dict[str, Any]]]:
+    """Extract slim tool calls from an item's tool_calls/tools_called value."""
+    if type(calls) is not list:
         return None
     slim: List[Dict[str, Any]] = []
     for c in calls:
-        if not isinstance(c, dict):
+        if type(c) is not dict:
             continue
-        entry = {k: c.get(k) for k in ("name", "arguments") if k in c}
+        entry = {k: c[k] for k in _TOOL_CALL_KEYS if k in c}
         if entry:
             slim.append(entry)
     return slim or None
 
 
-def _extract_context_from_messages(
-    messages: List[Dict[str, Any]],
+def _make_snippet(text: str, file_name: str, snippet_max_chars: int) -> str:
+    """
+    Build a context entry with source attribution, truncated to snippet_max_chars.
+    Same result as stripping, prefixing and truncating, but only the part
+    of the text that is kept gets copied.
+    """
+    prefix = f"[Source: {file_name}]\n" if file_name else ""
+    
+    # Find strip() bounds by skipping edge whitespace instead of copying the text
+    start, end = 0, len(text)
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    
+    if len(prefix) + end - start <= snippet_max_chars:
+        return prefix + text[start:end]
+    
+    stop = start + max(snippet_max_chars - len(prefix), 0)
+    return (prefix + text[start:stop])[:snippet_max_chars] + "..."
+
+
+def _extract_tool_contexts(
+    content: Any,
+    contexts: List[str],
     max_contexts: int,
     snippet_max_chars: int,
-) -> List[str]:
+) -> None:
     """
-    Extract context from tool role messages in a message list.
+    Append context snippets from a tool message's content to `contexts`.
     Looks for file_search tool results with KB article content.
     """
-    contexts: List[str] = []
+    if type(content) is not list:
+        return
     
-    for m in messages:
-        if not isinstance(m, dict):
+    for part in content:
+        if type(part) is not dict:
             continue
         
-        # Look for tool role messages
-        if m.get("role") != "tool":
+        # Look for tool_result type
+        if part.get("type") != "tool_result":
             continue
         
-        content = m.get("content")
-        if not isinstance(content, list):
+        tool_result = part.get("tool_result")
+        if type(tool_result) is not list:
             continue
         
-        for part in content:
-            if not isinstance(part, dict):
+        # Each tool_result contains multiple file results
+        for result in tool_result:
+            if type(result) is not dict:
                 continue
             
-            # Look for tool_result type
-            if part.get("type") != "tool_result":
-                continue
+            file_name = result.get("file_name", "")
+            result_content = result.get("content")
             
-            tool_result = part.get("tool_result")
-            if not isinstance(tool_result, list):
+            if type(result_content) is not list:
                 continue
             
-            # Each tool_result contains multiple file results
-            for result in tool_result:
-                if not isinstance(result, dict):
+            # Extract text from content
+            for content_part in result_content:
+                if type(content_part) is not dict:
                     continue
                 
-                file_name = result.get("file_name", "")
-                result_content = result.get("content")
-                
-                if not isinstance(result_content, list):
+                text = content_part.get("text", "")
+                if not text:
                     continue
                 
-                # Extract text from content
-                for content_part in result_content:
-                    if not isinstance(content_part, dict):
-                        continue
-                    
-                    text = content_part.get("text", "")
-                    if not text:
-                        continue
-                    
-                    # Create context entry with source attribution
-                    context_entry = text.strip()
-                    if file_name:
-                        context_entry = f"[Source: {file_name}]\n{context_entry}"
-                    
-                    # Truncate if needed
-                    if len(context_entry) > snippet_max_chars:
-                        context_entry = context_entry[:snippet_max_chars] + "..."
-                    
-                    contexts.append(context_entry)
-                    
-                    if len(contexts) >= max_contexts:
-                        return contexts
+                contexts.append(_make_snippet(text, file_name, snippet_max_chars))
+                
+                if len(contexts) >= max_contexts:
+                    return
+
+
+def _scan_messages(
+    messages: List[Dict[str, Any]],
+    role: str,
+    contexts: List[str],
+    max_contexts: int,
+    snippet_max_chars: int,
+) -> Optional[str]:
+    """
+    Single forward pass over a message list.
+    Returns the text of the last `role` message that has any, and appends
+    tool-result snippets to `contexts` in message order until it holds
+    max_contexts entries.
+    """
+    text: Optional[str] = None
+    
+    for m in messages:
+        if type(m) is not dict:
+            continue
+        
+        m_role = m.get("role")
+        if m_role == role:
+            # Keep overwriting so the last matching message wins
+            m_text = _message_text(m.get("content"))
+            if m_text is not None:
+                text = m_text
+        elif m_role == "tool" and len(contexts) < max_contexts:
+            _extract_tool_contexts(
+                m.get("content"), contexts, max_contexts, snippet_max_chars
+            )
     
-    return contexts
+    return text
+
+
+def _scan_field(
+    value: Any,
+    role: str,
+    contexts: List[str],
+    max_contexts: int,
+    snippet_max_chars: int,
+) -> Optional[str]:
+    """Get the text of a query/response field (string or message list), collecting tool-result contexts."""
+    if type(value) is str:
+        return value
+    if type(value) is list:
+        return _scan_messages(value, role, contexts, max_contexts, snippet_max_chars)
+    return None
 
 
 def _collect_context(item: Dict[str, Any]) -> Optional[List[str]]:
     """Collect context from explicit context fields."""
-    candidates = [
-        item.get("context"),
-        item.get("retrieved_context"),
-        item.get("evidence"),
-        item.get("citations"),
-    ]
-    for c in candidates:
+    get = item.get
+    for key in _CONTEXT_KEYS:
+        c = get(key)
         if not c:
             continue
-        if isinstance(c, str):
+        if type(c) is str:
             return [c]
-        if isinstance(c, list):
+        if type(c) is list:
             texts: List[str] = []
             for v in c:
-                if isinstance(v, str):
+                if type(v) is str:
                     texts.append(v)
-                elif isinstance(v, dict) and "text" in v:
+                elif type(v) is dict and "text" in v:
                     texts.append(str(v.get("text")))
             return texts or None
     return None
 
 
-def _build_context_from_tool_results(
-    item: Dict[str, Any], max_contexts: int, snippet_max_chars: int
-) -> Optional[List[str]]:
-    """Build context by extracting tool results from query and response messages."""
-    contexts: List[str] = []
-    
-    # Try to extract from query messages
-    q = item.get("query")
-    if isinstance(q, list):
-        contexts.extend(
-            _extract_context_from_messages(q, max_contexts, snippet_max_chars)
-        )
-    
-    # Try to extract from response messages if we need more
-    if len(contexts) < max_contexts:
-        r = item.get("response")
-        if isinstance(r, list):
-            more = _extract_context_from_messages(
-                r, max_contexts - len(contexts), snippet_max_chars
-            )
-            contexts.extend(more)
-    
-    return contexts if contexts else None
-
-
 def _get_ground_truth(item: Dict[str, Any]) -> Optional[str]:
     """Get ground truth answer."""
     gt = item.get("ground_truth") or item.get("reference_answer")
-    if isinstance(gt, str):
+    if type(gt) is str:
         return gt
     return None
 
@@ -242,7 +412,7 @@ def _get_doc_gt_and_retrieved(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Get ground truth and retrieved documents."""
     gt_docs = item.get("ground_truth_documents") or item.get("labels")
     ret_docs = item.get("retrieved_documents") or item.get("documents")
-    if isinstance(gt_docs, list) and isinstance(ret_docs, list):
+    if type(gt_docs) is list and type(ret_docs) is list:
         return {
             "ground_truth_documents": gt_docs,
             "retrieved_documents": ret_docs,
@@ -256,144 +426,313 @@ def postprocess(
     rag_snippets_k: int = 3,
     snippet_max_chars: int = 2000,
     debug: bool = False,
+    compress: bool = False,
+    workers: int = 1,
 ) -> Dict[str, str]:
     """
     Post-process evaluation JSONL into lean group-specific files.
     
     Args:
-        input_path: Path to input JSONL file
+        input_path: Path to input JSONL file (may be gzip-compressed, *.gz)
         out_dir: Directory to write output files
         rag_snippets_k: Max number of context snippets to extract (0 to disable)
         snippet_max_chars: Max characters per context snippet
-        debug: Print debug information
+        debug: Print debug information (forces a single worker)
+        compress: Write gzip-compressed *.jsonl.gz files instead of *.jsonl
+        workers: Number of worker processes; the input is split into line-aligned
+            byte ranges and the per-worker outputs are concatenated in order.
+            Gzip-compressed input is always processed by a single worker.
     """
-    general_rows: List[Dict[str, Any]] = []
-    agent_rows: List[Dict[str, Any]] = []
-    rag_rows: List[Dict[str, Any]] = []
-    docret_rows: List[Dict[str, Any]] = []
-    respcomp_rows: List[Dict[str, Any]] = []
-
-    for idx, item in enumerate(_read_jsonl(input_path)):
-        if debug:
-            print(f"\n=== Processing item {idx} ===")
-            print(f"Top-level keys: {list(item.keys())}")
-        
-        query = _last_user_query(item)
-        response = _final_assistant_response(item)
-        
-        if debug:
-            print(f"Query extracted: {bool(query)}")
-            print(f"Response extracted: {bool(response)}")
-            if query:
-                print(f"Query preview: {query[:100]}...")
-            if response:
-                print(f"Response preview: {response[:100]}...")
-        
-        if not query and isinstance(item.get("query"), dict):
-            query = json.dumps(item["query"], ensure_ascii=False)
-
-        # general & Security: query + response
-        if query or response:
-            general_rows.append({
-                k: v for k, v in (("query", query), ("response", response)) if v is not None
-            })
-
-        # Agent: query + response + tool_definitions + tool_calls
-        tool_defs = _slim_tool_definitions(item)
-        tool_calls = _slim_tool_calls(item)
-        agent_row: Dict[str, Any] = {
-            k: v for k, v in (("query", query), ("response", response)) if v is not None
-        }
-        if tool_defs:
-            agent_row["tool_definitions"] = tool_defs
-        if tool_calls:
-            agent_row["tool_calls"] = tool_calls
-        if agent_row:
-            agent_rows.append(agent_row)
-
-        # RAG: query + response + context
-        # First try explicit context fields
-        context = _collect_context(item)
-        
-        if debug:
-            print(f"Explicit context found: {bool(context)}")
-        
-        # If no explicit context, try to extract from tool results
-        if not context and rag_snippets_k > 0:
-            context = _build_context_from_tool_results(
-                item, rag_snippets_k, snippet_max_chars
-            )
-            if debug:
-                print(f"Context from tool results: {bool(context)}")
-                if context:
-                    print(f"Number of context snippets: {len(context)}")
-                    print(f"First snippet preview: {context[0][:200]}...")
-        
-        if context and query and response:
-            rag_rows.append({
-                "query": query,
-                "response": response,
-                "context": context,
-            })
-            if debug:
-                print("✓ Added to RAG rows")
-        elif debug:
-            print(f"✗ Not added to RAG rows - context:{bool(context)}, query:{bool(query)}, response:{bool(response)}")
+    ext = ".jsonl.gz" if compress else ".jsonl"
 
-        # Document Retrieval: query + ground_truth_documents + retrieved_documents
-        dr = _get_doc_gt_and_retrieved(item)
-        if dr:
-            base: Dict[str, Any] = {"query": query} if query is not None else {}
-            base.update(dr)
-            docret_rows.append(base)
-
-        # Response Completeness: query + response + ground_truth
-        gt = _get_ground_truth(item)
-        if gt and response:
-            respcomp_rows.append({
-                "query": query,
-                "response": response,
-                "ground_truth": gt,
-            })
+    if workers > 1 and not debug and not input_path.endswith(".gz"):
+        return _postprocess_parallel(
+            input_path, out_dir, ext, workers, rag_snippets_k, snippet_max_chars
+        )
 
-    outputs: Dict[str, str] = {}
+    writers = _write_groups(
+        _read_jsonl(input_path),
+        os.path.join(out_dir, ""),
+        ext,
+        rag_snippets_k,
+        snippet_max_chars,
+        debug,
+    )
 
     if debug:
+        counts = {group: w.count for group, w in writers.items()}
         print(f"\n=== Summary ===")
-        print(f"General rows: {len(general_rows)}")
-        print(f"Agent rows: {len(agent_rows)}")
-        print(f"RAG rows: {len(rag_rows)}")
-        print(f"DocRet rows: {len(docret_rows)}")
-        print(f"RespComp rows: {len(respcomp_rows)}")
-
-    if general_rows:
-        path = f"{out_dir}/general_qa.jsonl"
-        _write_jsonl(path, general_rows)
-        outputs["general_qa"] = path
-
-    if agent_rows:
-        path = f"{out_dir}/agent_basic.jsonl"
-        _write_jsonl(path, agent_rows)
-        outputs["agent_basic"] = path
-
-    if rag_rows:
-        path = f"{out_dir}/rag_core.jsonl"
-        _write_jsonl(path, rag_rows)
-        outputs["rag_core"] = path
-
-    if docret_rows:
-        path = f"{out_dir}/document_retrieval.jsonl"
-        _write_jsonl(path, docret_rows)
-        outputs["document_retrieval"] = path
-
-    if respcomp_rows:
-        path = f"{out_dir}/response_completeness.jsonl"
-        _write_jsonl(path, respcomp_rows)
-        outputs["response_completeness"] = path
+        print(f"General rows: {counts.get('general_qa', 0)}")
+        print(f"Agent rows: {counts.get('agent_basic', 0)}")
+        print(f"RAG rows: {counts.get('rag_core', 0)}")
+        print(f"DocRet rows: {counts.get('document_retrieval', 0)}")
+        print(f"RespComp rows: {counts.get('response_completeness', 0)}")
+
+    return {group: writers[group].path for group in _GROUPS if group in writers}
+
+
+def _write_groups(
+    items: Iterable[Dict[str, Any]],
+    prefix: str,
+    ext: str,
+    rag_snippets_k: int,
+    snippet_max_chars: int,
+    debug: bool,
+) -> Dict[str, _JsonlWriter]:
+    """
+    Process items into committed per-group files named `prefix + group + ext`;
+    nothing is left behind on error.
+    """
+    writers: Dict[str, _JsonlWriter] = {}
+
+    def emit(group: str, row: Dict[str, Any]) -> None:
+        # Output files are only created once their group gets a first row
+        w = writers.get(group)
+        if w is None:
+            w = writers[group] = _JsonlWriter(f"{prefix}{group}{ext}", group + ext)
+        w.write(row)
+
+    # Pick the loop once rather than testing `debug` throughout the per-item work
+    process = _process_items_debug if debug else _process_items
+    try:
+        process(items, emit, rag_snippets_k, snippet_max_chars)
+    except BaseException:
+        for w in writers.values():
+            w.discard()
+        raise
+
+    for w in writers.values():
+        w.commit()
+    return writers
+
+
+def _process_range(
+    input_path: str,
+    start: int,
+    end: int,
+    part_prefix: str,
+    ext: str,
+    rag_snippets_k: int,
+    snippet_max_chars: int,
+) -> Dict[str, str]:
+    """Worker: process one byte range of the input into per-group part files."""
+    writers = _write_groups(
+        _read_jsonl(input_path, start, end),
+        part_prefix,
+        ext,
+        rag_snippets_k,
+        snippet_max_chars,
+        debug=False,
+    )
+    return {group: w.path for group, w in writers.items()}
 
+
+def _postprocess_parallel(
+    input_path: str,
+    out_dir: str,
+    ext: str,
+    workers: int,
+    rag_snippets_k: int,
+    snippet_max_chars: int,
+) -> Dict[str, str]:
+    """Fan byte ranges out to a process pool, then concatenate part files in order."""
+    ranges = _split_line_ranges(input_path, workers)
+    parts: List[Dict[str, str]] = []
+    futures = []
+    try:
+        with ProcessPoolExecutor(max_workers=len(ranges) or 1) as pool:
+            futures = [
+                pool.submit(
+                    _process_range,
+                    input_path,
+                    start,
+                    end,
+                    os.path.join(out_dir, f".part{n}."),
+                    ext,
+                    rag_snippets_k,
+                    snippet_max_chars,
+                )
+                for n, (start, end) in enumerate(ranges)
+            ]
+            for fut in futures:
+                parts.append(fut.result())
+    except BaseException:
+        for fut in futures:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                for path in fut.result().values():
+                    os.remove(path)
+        raise
+
+    outputs: Dict[str, str] = {}
+    for group in _GROUPS:
+        part_paths = [p[group] for p in parts if group in p]
+        if not part_paths:
+            continue
+        path = os.path.join(out_dir, group + ext)
+        tmp_path = path + ".tmp"
+        # Gzip members concatenate into a valid multi-member gzip stream
+        with open(tmp_path, "wb") as out:
+            for part_path in part_paths:
+                with open(part_path, "rb") as src:
+                    shutil.copyfileobj(src, out, _IO_BUFFER_SIZE)
+                os.remove(part_path)
+        os.replace(tmp_path, path)
+        outputs[group] = path
     return outputs
 
 
+def _item_fields(
+    item: Dict[str, Any],
+    raw_query: Any,
+    raw_response: Any,
+    rag_snippets_k: int,
+    snippet_max_chars: int,
+) -> Tuple[Optional[str], Optional[str], Optional[List[str]], List[str]]:
+    """
+    Extract (query, response, explicit context, tool-result context) from an item.
+    raw_query/raw_response are the item's "query"/"response" values, looked up
+    once by the caller.
+    """
+    # Explicit context fields take precedence over tool-result snippets,
+    # so only collect snippets while scanning messages if there are none
+    explicit_context = _collect_context(item)
+    max_ctx = rag_snippets_k if not explicit_context and rag_snippets_k > 0 else 0
+    
+    # Query and response share one snippet list, capped at max_ctx in total
+    tool_context: List[str] = []
+    query = _scan_field(raw_query, "user", tool_context, max_ctx, snippet_max_chars)
+    response = _scan_field(
+        raw_response, "assistant", tool_context, max_ctx, snippet_max_chars
+    )
+    return query, response, explicit_context, tool_context
+
+
+def _emit_item_rows(
+    item: Dict[str, Any],
+    query: Optional[str],
+    response: Optional[str],
+    context: Optional[List[str]],
+    emit: Callable[[str, Dict[str, Any]], None],
+) -> None:
+    """Emit an item's rows to every output group it has the fields for."""
+    qr_row: Dict[str, Any] = {}
+    if query is not None:
+        qr_row["query"] = query
+    if response is not None:
+        qr_row["response"] = response
+
+    # general & Security: query + response
+    if query or response:
+        emit("general_qa", qr_row)
+
+    # Agent: query + response + tool_definitions + tool_calls
+    # (optional fields are usually absent, so look them up once and only
+    # call into the helpers when there is something to slim)
+    tools = item.get("tool_definitions") or item.get("tools")
+    tool_defs = _slim_tool_definitions(tools) if tools else None
+    calls = item.get("tool_calls") or item.get("tools_called")
+    tool_calls = _slim_tool_calls(calls) if calls else None
+    agent_row = qr_row.copy()
+    if tool_defs:
+        agent_row["tool_definitions"] = tool_defs
+    if tool_calls:
+        agent_row["tool_calls"] = tool_calls
+    if agent_row:
+        emit("agent_basic", agent_row)
+
+    # RAG: query + response + context
+    if context and query and response:
+        emit("rag_core", {
+            "query": query,
+            "response": response,
+            "context": context,
+        })
+
+    # Document Retrieval: query + ground_truth_documents + retrieved_documents
+    dr = (
+        _get_doc_gt_and_retrieved(item)
+        if "ground_truth_documents" in item or "labels" in item
+        else None
+    )
+    if dr:
+        base: Dict[str, Any] = {"query": query} if query is not None else {}
+        base.update(dr)
+        emit("document_retrieval", base)
+
+    # Response Completeness: query + response + ground_truth
+    gt = (
+        _get_ground_truth(item)
+        if "ground_truth" in item or "reference_answer" in item
+        else None
+    )
+    if gt and response:
+        emit("response_completeness", {
+            "query": query,
+            "response": response,
+            "ground_truth": gt,
+        })
+
+
+def _process_items(
+    items: Iterable[Dict[str, Any]],
+    emit: Callable[[str, Dict[str, Any]], None],
+    rag_snippets_k: int,
+    snippet_max_chars: int,
+) -> None:
+    """Transform each input item and emit its rows to the matching output groups."""
+    for item in items:
+        raw_query = item.get("query")
+        query, response, explicit_context, tool_context = _item_fields(
+            item, raw_query, item.get("response"), rag_snippets_k, snippet_max_chars
+        )
+        if not query and type(raw_query) is dict:
+            query = _dumps_str(raw_query)
+        context = explicit_context or tool_context or None
+        _emit_item_rows(item, query, response, context, emit)
+
+
+def _process_items_debug(
+    items: Iterable[Dict[str, Any]],
+    emit: Callable[[str, Dict[str, Any]], None],
+    rag_snippets_k: int,
+    snippet_max_chars: int,
+) -> None:
+    """Same as _process_items, printing what was extracted from each item."""
+    for idx, item in enumerate(items):
+        print(f"\n=== Processing item {idx} ===")
+        print(f"Top-level keys: {list(item.keys())}")
+        
+        raw_query = item.get("query")
+        query, response, explicit_context, tool_context = _item_fields(
+            item, raw_query, item.get("response"), rag_snippets_k, snippet_max_chars
+        )
+        
+        print(f"Query extracted: {bool(query)}")
+        print(f"Response extracted: {bool(response)}")
+        if query:
+            print(f"Query preview: {query[:100]}...")
+        if response:
+            print(f"Response preview: {response[:100]}...")
+        
+        if not query and type(raw_query) is dict:
+            query = _dumps_str(raw_query)
+        context = explicit_context or tool_context or None
+        
+        print(f"Explicit context found: {bool(explicit_context)}")
+        if not explicit_context and rag_snippets_k > 0:
+            print(f"Context from tool results: {bool(context)}")
+            if context:
+                print(f"Number of context snippets: {len(context)}")
+                print(f"First snippet preview: {context[0][:200]}...")
+        
+        if context and query and response:
+            print("✓ Added to RAG rows")
+        else:
+            print(f"✗ Not added to RAG rows - context:{bool(context)}, query:{bool(query)}, response:{bool(response)}")
+        
+        _emit_item_rows(item, query, response, context, emit)
+
+
 if __name__ == "__main__":
     import argparse
 
@@ -419,6 +758,17 @@ if __name__ == "__main__":
         action="store_true",
         help="Enable debug output",
     )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Write gzip-compressed .jsonl.gz output files",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to split the input across",
+    )
     args = parser.parse_args()
 
     result = postprocess(
@@ -427,6 +777,8 @@ if __name__ == "__main__":
         rag_snippets_k=args.rag_snippets_k,
         snippet_max_chars=args.snippet_max_chars,
         debug=args.debug,
+        compress=args.gzip,
+        workers=args.workers,
     )
     print(json.dumps(result, indent=2))
 
@@ -1,46 +1,196 @@
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
-from azure.ai.agents.models import ListSortOrder
-
-# Initialize client
-project = AIProjectClient(
-    credential=DefaultAzureCredential(),
-    endpoint="https://prabh-mfb885mz-swedencentral.services.ai.azure.com/api/projects/prabh-mfb885mz-swedence-project")
-
-agent = project.agents.get_agent("asst_GHYn52a8aVGYJehtyWYjuDGw")
-print(f"Connected to agent, ID: {agent.id}")
-
-thread = project.agents.threads.create()
-print(f"Created thread, ID: {thread.id}")
-
-MESSAGE = "What are the approved email domains for MS Teams verification when resetting a password?"
-
-message = project.agents.messages.create(
-    thread_id=thread.id,
-    role="user",
-    content= MESSAGE
-)
-print(f"Created message, ID: {message.id}")
-
-run = project.agents.runs.create_and_process(
-    thread_id=thread.id,
-    agent_id=agent.id)
-
-if run.status == "failed":
-    print(f"Run failed: {run.last_error}")
-else:
-    print(f"Run finished with status: {run.status}")
-
-    messages = project.agents.messages.list(thread_id=thread.id, order=ListSortOrder.ASCENDING)
-
-    for message in messages:
-        if message.text_messages:
-            print(f"{message.role}: {message.text_messages[-1].text.value}")
-
-    # for message in project.agents.messages.list(thread.id, order="asc"):
-    #     print(f"Role: {message.role}")
-    #     print(f"Content: {message.content[0].text.value}")
-    #     print("-" * 40)
-
-print(f"Run ID: {run.id}")
-
+import asyncio
+import logging
+import sys
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.ai.projects.aio import AIProjectClient
+from azure.identity.aio import DefaultAzureCredential
+from azure.ai.agents.models import (
+    AgentStreamEvent,
+    MessageDeltaChunk,
+    MessageRole,
+    ThreadMessageOptions,
+    ThreadRun,
+)
+
+ENDPOINT = "https://prabh-mfb885mz-swedencentral.services.ai.azure.com/api/projects/prabh-mfb885mz-swedence-project"
+AGENT_ID = "asst_GHYn52a8aVGYJehtyWYjuDGw"
+
+MESSAGE = "What are the approved email domains for MS Teams verification when resetting a password?"
+
+log = logging.getLogger(__name__)
+
+
+async def _warm_up(session, url):
+    # Open a connection to the endpoint and leave it in the session's pool. The
+    # (unauthenticated, tiny) response is read in full so the connection can be
+    # reused; if this fails or is slow the real request simply connects itself.
+    try:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+            await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+
+
+class RunError(RuntimeError):
+    """An agent run that did not start or did not complete."""
+
+
+def _run_details(run):
+    # Why a run stopped short, if the service said: ": <details>" or "".
+    details = run.incomplete_details or run.last_error
+    return f": {details}" if details else ""
+
+
+async def run_prompt(project, agent_id, prompt, echo=False, max_completion_tokens=None):
+    thread = await project.agents.threads.create()
+    log.debug("Created thread, ID: %s", thread.id)
+
+    # Stream the run instead of polling it to completion: assistant text is
+    # collected (and echoed, if asked) as it is generated and the final ThreadRun
+    # event carries the status.
+    # The user message is added by the run request itself rather than by a
+    # separate messages.create call. max_completion_tokens caps the length of the
+    # reply (the run ends as "incomplete" if it is reached); None leaves it to the agent.
+    run = None
+    reply = []
+    async with await project.agents.runs.stream(
+        thread_id=thread.id,
+        agent_id=agent_id,
+        additional_messages=[ThreadMessageOptions(role=MessageRole.USER, content=prompt)],
+        max_completion_tokens=max_completion_tokens,
+    ) as stream:
+        async for event_type, event_data, _ in stream:
+            if isinstance(event_data, MessageDeltaChunk):
+                if echo:
+                    if not reply:
+                        print("assistant: ", end="")
+                    print(event_data.text, end="", flush=True)
+                reply.append(event_data.text)
+            elif isinstance(event_data, ThreadRun):
+                run = event_data
+            elif event_type == AgentStreamEvent.ERROR:
+                log.error("Stream error: %s", event_data)
+    if echo:
+        print()
+
+    if run is None:
+        raise RunError(f"Run on thread {thread.id} did not start")
+
+    log.debug("Run ID: %s", run.id)
+    # Only a completed run yields a reply; anything else (failed, incomplete
+    # because max_completion_tokens was reached, cancelled, expired) raises so
+    # the caller reports it instead of passing on partial text.
+    status = getattr(run.status, "value", run.status)  # RunStatus member or plain str
+    if status != "completed":
+        raise RunError(f"Run {run.id} on thread {thread.id} ended with status {status}{_run_details(run)}")
+    log.debug("Run finished with status: %s", status)
+    return "".join(reply)
+
+
+async def main(prompts=(MESSAGE,), max_completion_tokens=None, dedupe=False):
+    # Initialize client. Every request goes through one pooled aiohttp session,
+    # so TCP/TLS connections to the endpoint are reused rather than re-established.
+    # Several prompts can be run on the same client, sharing its connections and
+    # the token it acquires. Each streaming run holds a connection until it
+    # finishes, so the connection limit also bounds how many run at once. Idle
+    # connections are kept for two minutes (aiohttp's default is 15 seconds) so
+    # they survive the gaps between runs, and the endpoint's DNS answer is cached
+    # for five minutes (default 10 seconds) so new connections skip the lookup.
+    # trust_env keeps HTTP(S)_PROXY/NO_PROXY and .netrc working, as they do when
+    # AioHttpTransport creates its own session.
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=120, ttl_dns_cache=300),
+        trust_env=True,
+    ) as session, DefaultAzureCredential(
+        # Skip the sources this script is never authenticated through. The shared
+        # token cache is otherwise probed before the Azure CLI on every run;
+        # environment, workload and managed identity stay for CI and hosted use.
+        exclude_shared_token_cache_credential=True,
+        exclude_visual_studio_code_credential=True,
+        exclude_powershell_credential=True,
+        exclude_developer_cli_credential=True,
+    ) as credential, AIProjectClient(
+        credential=credential,
+        endpoint=ENDPOINT,
+        transport=AioHttpTransport(session=session, session_owner=False),
+    ) as project:
+
+        # The agent ID is fixed, so there is no need to fetch the agent first.
+        log.debug("Using agent, ID: %s", AGENT_ID)
+
+        # The first request has to wait for a token from the credential chain;
+        # connect to the endpoint in the meantime so it can reuse a warm connection.
+        warm_up = asyncio.create_task(_warm_up(session, ENDPOINT))
+        try:
+            if len(prompts) == 1:
+                # A single prompt is echoed as it streams in.
+                try:
+                    await run_prompt(project, AGENT_ID, prompts[0], echo=True, max_completion_tokens=max_completion_tokens)
+                except RunError as e:
+                    log.error("%s", e)
+            else:
+                # Independent prompts run concurrently, each on its own thread; the
+                # replies are printed once all of them have finished. A repeated prompt
+                # is normally another sample and gets its own run; with dedupe, a
+                # prompt repeated verbatim is run once and its reply reused.
+                batch = list(dict.fromkeys(prompts)) if dedupe else list(prompts)
+                replies = await asyncio.gather(
+                    *(run_prompt(project, AGENT_ID, prompt, max_completion_tokens=max_completion_tokens)
+                      for prompt in batch),
+                    return_exceptions=True,
+                )
+                # A run that raises (including a RunError for a run that did not
+                # complete) is reported on its own, naming its prompt, rather than
+                # tearing down the client under the runs that are still streaming;
+                # only completed replies are printed.
+                for prompt, reply in zip(batch, replies):
+                    if isinstance(reply, BaseException):
+                        log.error("Prompt %r failed: %s: %s", prompt, type(reply).__name__, reply)
+                if dedupe:
+                    by_prompt = dict(zip(batch, replies))
+                    replies = [by_prompt[prompt] for prompt in prompts]
+                sys.stdout.write("".join(
+                    f"user: {prompt}\nassistant: {reply}\n"
+                    for prompt, reply in zip(prompts, replies)
+                    if not isinstance(reply, BaseException)
+                ))
+                sys.stdout.flush()
+        finally:
+            # The warm-up is only useful before the first request; never wait on it.
+            warm_up.cancel()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ask the agent one or more questions")
+    parser.add_argument(
+        "prompts",
+        nargs="*",
+        default=[MESSAGE],
+        help="Questions to ask the agent (default: the built-in MESSAGE)",
+    )
+    parser.add_argument(
+        "--max_completion_tokens",
+        type=int,
+        default=None,
+        help="Cap on completion tokens per run",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Run a prompt given more than once (exact match) only once",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Also log agent, thread and run IDs and the status of completed runs",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(message)s")
+    log.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+
+    asyncio.run(main(args.prompts, max_completion_tokens=args.max_completion_tokens, dedupe=args.dedupe))